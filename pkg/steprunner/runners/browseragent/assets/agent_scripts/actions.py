@@ -1,105 +1,247 @@
+import asyncio
+import functools
+import logging
 import os
+import stat
+import time
 from pathlib import Path
-from datetime import datetime, timezone
+from typing import Optional
 from browser_use import BrowserSession, ActionResult
 
-async def upload_file_action_impl(
-    index: int,
-    path: str,
-    browser_session: BrowserSession,
-    available_file_paths: list[str],
-):
-    abs_path = os.path.abspath(path)
-    available_abs_paths = [os.path.abspath(p) for p in available_file_paths]
-    if abs_path not in available_abs_paths:
-        return ActionResult(
-            error=f"File path {path} (resolved: {abs_path}) is not in the allowed list: {available_abs_paths}"
-        )
+__all__ = [
+    "make_upload_file_action",
+    "clear_path_cache",
+    "get_last_downloaded_file_info_impl",
+    "make_click_and_wait_for_download_action",
+    "force_click_element_impl",
+]
+
+logger = logging.getLogger("dropstep.actions")
+
+DEFAULT_DOWNLOAD_TIMEOUT_MS = 30000
+
+@functools.lru_cache(maxsize=1024)
+def _realpath(path: str) -> str:
+    return os.path.realpath(path)
+
+
+def clear_path_cache() -> None:
+    _realpath.cache_clear()
+
+
+def make_upload_file_action(allowed_abs_paths: frozenset[str]):
+    """
+    Builds the upload action bound to a pre-resolved allow-list, so each call is a single
+    realpath + set lookup instead of re-resolving every allowed path.
+    """
+    allowed_display = sorted(allowed_abs_paths)
+
+    async def upload_file_action_impl(
+        index: int,
+        path: str,
+        browser_session: BrowserSession,
+    ):
+        abs_path = _realpath(path)
+        if abs_path not in allowed_abs_paths:
+            return ActionResult(
+                error=f"File path {path} (resolved: {abs_path}) is not in the allowed list: {allowed_display}"
+            )
+
+        el_info = await browser_session.find_file_upload_element_by_index(index)
+        if not el_info:
+            return ActionResult(error=f"No file-upload element found at index {index}")
+        handle = await browser_session.get_locate_element(el_info)
+        try:
+            # upload the resolved file that passed the check, even if a cached symlink moved since
+            await handle.set_input_files(abs_path)
+            return ActionResult(extracted_content=f"Successfully uploaded file “{path}” to element at index {index}.", include_in_memory=True)
+        except Exception as e:
+            return ActionResult(error=f"Failed to upload file “{path}” at index {index}: {str(e)}")
+
+    return upload_file_action_impl
+
+# downloads dir -> (dir mtime_ns, name of the newest file) as of the last full scan
+_latest_download_cache: dict[str, tuple[int, str]] = {}
+
+
+def _latest_file_in_dir(target_dir: str) -> Optional[tuple[str, os.stat_result]]:
+    """
+    Returns (path, stat) of the most recently modified file in target_dir. Creating, removing or
+    renaming an entry bumps the directory's mtime, so while it is unchanged the previous winner is
+    still the newest file and only that file is stat'ed instead of re-listing the directory.
+    """
+    dir_mtime_ns = os.stat(target_dir).st_mtime_ns
+    cached = _latest_download_cache.get(target_dir)
+    if cached and cached[0] == dir_mtime_ns:
+        path = os.path.join(target_dir, cached[1])
+        try:
+            return path, os.lstat(path)
+        except FileNotFoundError:
+            pass
+    # one pass keeping only the running winner; is_file() comes from the dirent type, and the one
+    # stat per file is reused for the payload
+    latest = None
+    with os.scandir(target_dir) as it:
+        for e in it:
+            if not e.is_file(follow_symlinks=False):
+                continue
+            st = e.stat(follow_symlinks=False)
+            if latest is None or st.st_mtime_ns > latest[1].st_mtime_ns:
+                latest = (e, st)
+    if latest is None:
+        _latest_download_cache.pop(target_dir, None)
+        return None
+    _latest_download_cache[target_dir] = (dir_mtime_ns, latest[0].name)
+    return latest[0].path, latest[1]
 
-    el_info = await browser_session.find_file_upload_element_by_index(index)
-    if not el_info:
-        return ActionResult(error=f"No file-upload element found at index {index}")
-    handle = await browser_session.get_locate_element(el_info)
+
+@functools.lru_cache(maxsize=256)
+def _utc_seconds_stamp(seconds: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+
+
+def _iso_utc(mtime_ns: int) -> str:
+    """UTC isoformat() of mtime_ns rounded to the microsecond, as datetime does, without building a datetime."""
+    seconds, ns = divmod(mtime_ns, 1_000_000_000)
+    # datetime rounds to the nearest microsecond (half to even), carrying into the seconds
+    micros, rem = divmod(ns, 1000)
+    if rem > 500 or (rem == 500 and micros % 2):
+        micros += 1
+        if micros == 1_000_000:
+            seconds += 1
+            micros = 0
+    # the same download is usually reported several times, so the whole-second part is cached
+    stamp = _utc_seconds_stamp(seconds)
+    return f"{stamp}.{micros:06d}+00:00" if micros else f"{stamp}+00:00"
+
+
+def _stat_or_none(path) -> Optional[os.stat_result]:
     try:
-        await handle.set_input_files(path)
-        return ActionResult(extracted_content=f"Successfully uploaded file “{path}” to element at index {index}.", include_in_memory=True)
-    except Exception as e:
-        return ActionResult(error=f"Failed to upload file “{path}” at index {index}: {str(e)}")
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _snapshot_files(target_dir: str) -> dict[str, int]:
+    with os.scandir(target_dir) as it:
+        return {e.name: e.stat(follow_symlinks=False).st_mtime_ns for e in it if e.is_file(follow_symlinks=False)}
+
+
+def _newest_changed_file(target_dir: str, before: dict[str, int]) -> Optional[tuple[str, os.stat_result]]:
+    """Returns (path, stat) of the newest non-empty file that appeared or changed since the `before` snapshot."""
+    newest = None
+    with os.scandir(target_dir) as it:
+        for e in it:
+            if not e.is_file(follow_symlinks=False):
+                continue
+            st = e.stat(follow_symlinks=False)
+            if st.st_size == 0 or before.get(e.name) == st.st_mtime_ns:
+                continue
+            if newest is None or st.st_mtime_ns > newest[1].st_mtime_ns:
+                newest = (e.path, st)
+    return newest
+
+
+# download dirs already created by this process; the check is once per dir, not once per click
+_ensured_download_dirs: set[Path] = set()
+
+
+def _record_download(target_dir: str, filename: str) -> None:
+    # an overwrite in place doesn't touch the directory mtime, so remember what we just saved
+    try:
+        _latest_download_cache[target_dir] = (os.stat(target_dir).st_mtime_ns, filename)
+    except OSError:
+        _latest_download_cache.pop(target_dir, None)
+
 
 async def get_last_downloaded_file_info_impl(
     browser_session: BrowserSession,
 ) -> ActionResult:
     if not browser_session.browser_profile or not browser_session.browser_profile.downloads_dir:
         return ActionResult(error="Browser download directory not configured in session profile.")
-    target_dir = Path(browser_session.browser_profile.downloads_dir)
-    if not target_dir.exists():
+    target_dir = os.path.abspath(browser_session.browser_profile.downloads_dir)
+    try:
+        latest = _latest_file_in_dir(target_dir)
+    except FileNotFoundError:
         return ActionResult(error=f"Target download directory '{target_dir}' does not exist.")
-    files_in_dir = [f for f in target_dir.iterdir() if f.is_file()]
-    if not files_in_dir:
+    if latest is None:
         return ActionResult(extracted_content="No files found in the target download directory.", include_in_memory=True)
-    try:
-        latest_file = max(files_in_dir, key=lambda f: f.stat().st_mtime)
-    except ValueError:
-         return ActionResult(extracted_content="No files to determine latest in target download directory.", include_in_memory=True)
+    latest_path, latest_stat = latest
+    latest_name = os.path.basename(latest_path)
     file_info_payload = {
-        "actual_downloaded_filename": latest_file.name,
-        "download_path": str(latest_file.resolve()),
-        "size_bytes": latest_file.stat().st_size,
-        "modified_time_utc": datetime.fromtimestamp(latest_file.stat().st_mtime, tz=timezone.utc).isoformat(),
+        "actual_downloaded_filename": latest_name,
+        "download_path": latest_path,
+        "size_bytes": latest_stat.st_size,
+        "modified_time_utc": _iso_utc(latest_stat.st_mtime_ns),
         "status": "confirmed_in_target_dir"
     }
     return ActionResult(
-        extracted_content=f"Confirmed latest file in target download directory: {latest_file.name}",
+        extracted_content=f"Confirmed latest file in target download directory: {latest_name}",
         payload=file_info_payload, 
         include_in_memory=True
     )
 
 
-async def click_and_wait_for_download_impl(
-    index: int, 
+def make_click_and_wait_for_download_action(timeout_ms: int = DEFAULT_DOWNLOAD_TIMEOUT_MS):
+    """
+    Builds the download action with how long to wait, after the click, for the download to start.
+    Completion is not bounded: save_as() resolves on Playwright's own download-finished event.
+    """
+    async def click_and_wait_for_download_impl(
+        index: int,
+        browser_session: BrowserSession,
+    ) -> ActionResult:
+        return await _click_and_wait_for_download(index, browser_session, timeout_ms)
+
+    return click_and_wait_for_download_impl
+
+
+async def _click_and_wait_for_download(
+    index: int,
     browser_session: BrowserSession,
+    timeout_ms: int,
 ) -> ActionResult:
     if not browser_session.browser_profile or not browser_session.browser_profile.downloads_dir:
         return ActionResult(error="Browser download directory not configured in session profile.")
     target_dir = Path(browser_session.browser_profile.downloads_dir)
     
-    if not target_dir.exists():
+    if target_dir not in _ensured_download_dirs:
         try:
             target_dir.mkdir(parents=True, exist_ok=True)
         except Exception as e_mkdir:
             return ActionResult(error=f"Target download directory '{target_dir}' does not exist and could not be created: {e_mkdir}")
+        _ensured_download_dirs.add(target_dir)
 
     page = await browser_session.get_current_page()
     if not page:
         return ActionResult(error="No active page found in browser session.")
 
     element_handle = None
-    el_info = None # Define el_info here so it's in scope for the print after try block
+    el_info = None
     try:
-        current_state_summary = await browser_session.get_state_summary(cache_clickable_elements_hashes=True)
-        
-        if not current_state_summary or not current_state_summary.selector_map:
-            return ActionResult(error="Failed to get page state or no interactive elements found.")
+        # the index refers to the state the LLM just planned against, which browser_use caches and
+        # re-validates between actions; only take a fresh DOM snapshot if that cache can't answer
+        selector_map = await browser_session.get_selector_map()
+        if index not in selector_map:
+            # a lookup only: hashing every clickable element would also overwrite the hashes the
+            # agent's next step diffs against to mark new elements
+            current_state_summary = await browser_session.get_state_summary(cache_clickable_elements_hashes=False)
 
-        el_info = current_state_summary.selector_map.get(index) # el_info is DOMElementNode
-        
-        debug_label = "N/A"
-        debug_role = "N/A"
-        debug_tag = "N/A"
-        if el_info:
-            if hasattr(el_info, 'attributes') and isinstance(el_info.attributes, dict):
-                debug_label = el_info.attributes.get('aria-label', debug_label)
-                debug_role = el_info.attributes.get('role', debug_role)
-            if hasattr(el_info, 'tag_name'): # DOMElementNode has tag_name
-                debug_tag = el_info.tag_name
-            elif hasattr(el_info, 'html_tag'): # Fallback if structure changes
-                debug_tag = el_info.html_tag
-        
-        if not el_info: # Check el_info after trying to populate debug strings
+            if not current_state_summary or not current_state_summary.selector_map:
+                return ActionResult(error="Failed to get page state or no interactive elements found.")
+            selector_map = current_state_summary.selector_map
+
+        el_info = selector_map.get(index) # el_info is DOMElementNode
+        if not el_info:
             return ActionResult(error=f"Element with index {index} not found in current page's interactive elements.")
-        
+        logger.debug("Download click target %d: %s", index, el_info)
+
         element_handle = await browser_session.get_locate_element(el_info) # This should accept DOMElementNode
         if not element_handle:
+            debug_label = "N/A"
+            if isinstance(getattr(el_info, 'attributes', None), dict):
+                debug_label = el_info.attributes.get('aria-label', debug_label)
+            debug_tag = getattr(el_info, 'tag_name', None) or getattr(el_info, 'html_tag', "N/A")
             return ActionResult(error=f"Could not get Playwright handle for element index {index} (tag: {debug_tag}, label: {debug_label}).")
 
     except Exception as e_find: # Catch any other unexpected error during element finding
@@ -107,13 +249,22 @@ async def click_and_wait_for_download_impl(
 
     # --- Perform click and wait for download ---
     try:
-        async with page.expect_download(timeout=30000) as download_info_ctx:
-            click_target_text = "N/A"
-            try:
-                click_target_text = await element_handle.text_content(timeout=1000)
-            except:
-                pass # Ignore if text_content fails, not critical for click
-            await element_handle.click(timeout=10000) 
+        # what the directory held before the click, to find the real file if save_as() misses
+        # a directory walk blocks for as long as the directory is big; run it next to the loop
+        try:
+            files_before_click = await asyncio.to_thread(_snapshot_files, str(target_dir))
+        except FileNotFoundError:
+            # removed after it was first created, e.g. by a cleanup job between --serve tasks
+            target_dir.mkdir(parents=True, exist_ok=True)
+            files_before_click = {}
+        async with page.expect_download(timeout=timeout_ms) as download_info_ctx:
+            if logger.isEnabledFor(logging.DEBUG):
+                # an extra browser round-trip, only worth paying when someone reads it
+                try:
+                    logger.debug("Clicking %r to trigger a download", await element_handle.text_content(timeout=1000))
+                except Exception:
+                    pass # Ignore if text_content fails, not critical for click
+            await element_handle.click(timeout=10000)
         
         download = await download_info_ctx.value 
 
@@ -122,10 +273,12 @@ async def click_and_wait_for_download_impl(
         
         await download.save_as(save_path)
 
-        if not save_path.is_file() or save_path.stat().st_size == 0:
-            alternative_path_in_target = target_dir / suggested_filename
-            if alternative_path_in_target.is_file() and alternative_path_in_target.stat().st_size > 0:
-                save_path = alternative_path_in_target
+        # one stat drives the is-file, size and mtime checks below
+        save_stat = _stat_or_none(save_path)
+        if save_stat is None or not stat.S_ISREG(save_stat.st_mode) or save_stat.st_size == 0:
+            changed = await asyncio.to_thread(_newest_changed_file, str(target_dir), files_before_click)
+            if changed:
+                save_path, save_stat = Path(changed[0]), changed[1]
             else:
                 temp_download_path_str = "unknown Playwright temp location"
                 try:
@@ -133,12 +286,13 @@ async def click_and_wait_for_download_impl(
                 except Exception:
                     pass # Ignore if path() fails here
                 return ActionResult(error=f"File '{suggested_filename}' not properly saved to '{save_path}'. It might be in Playwright's temp cache: '{temp_download_path_str}' or download failed.")
+        _record_download(str(target_dir), save_path.name)
         
         file_info_payload = {
             "actual_downloaded_filename": save_path.name,
-            "download_path": str(save_path.resolve()),
-            "size_bytes": save_path.stat().st_size,
-            "modified_time_utc": datetime.fromtimestamp(save_path.stat().st_mtime, tz=timezone.utc).isoformat(),
+            "download_path": os.path.abspath(save_path),
+            "size_bytes": save_stat.st_size,
+            "modified_time_utc": _iso_utc(save_stat.st_mtime_ns),
             "status": "download_successful_and_saved"
         }
         return ActionResult(
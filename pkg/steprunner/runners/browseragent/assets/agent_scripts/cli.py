@@ -1,19 +1,53 @@
 import argparse
+import functools
+import os
 
 
-def parse_agent_args():
+@functools.lru_cache(maxsize=1)
+def _parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Dropstep Browser Agent")
-    p.add_argument("--prompt", required=True, help="The LLM task prompt")
+    task_group = p.add_mutually_exclusive_group(required=True)
+    task_group.add_argument("--prompt", help="The LLM task prompt")
+    task_group.add_argument(
+        "--prompts-file",
+        type=str,
+        default=None,
+        help=(
+            "Path to a JSONL file of tasks to run concurrently. Each line is a JSON string or an object "
+            "with a 'prompt' key and optional 'output_schema', 'upload_file_paths', 'target_download_dir' "
+            "and 'estimated_seconds' (longest tasks are started first)."
+        ),
+    )
+    task_group.add_argument(
+        "--serve",
+        type=str,
+        default=None,
+        metavar="SOCKET_PATH",
+        help=(
+            "Keep the agent runtime warm and accept tasks on a Unix domain socket. Each request is a "
+            'JSON line {"prompt": ..., "out": ...}, optionally with "output_schema", "upload_file_paths" and '
+            '"target_download_dir"; '
+            'each reply is a JSON line {"ok": ..., "out": ..., "target_download_dir": ...}. Requests on one connection run one at '
+            "a time, in order; open several connections to run tasks concurrently."
+        ),
+    )
     p.add_argument(
         "--out",
         default=".dropstep/output/result.json",
-        help="Where to write the JSON result",
+        help="Where to write the JSON result. With --prompts-file, each task writes to a per-task suffixed path (e.g. result_0.json).",
+    )
+    p.add_argument(
+        "--results-jsonl",
+        type=str,
+        default=None,
+        help="With --prompts-file, also append one JSON line per finished task (index, prompt, ok, result) to this file.",
     )
     p.add_argument(
         "--upload-file-paths",
         nargs="*",
+        type=os.path.realpath,
         default=[],
-        help="List of local file paths available for upload by the agent for this task",
+        help="List of local file paths available for upload by the agent for this task. Stored fully resolved.",
     )
     p.add_argument(
         "--output-schema",
@@ -31,7 +65,11 @@ def parse_agent_args():
         "--target-download-dir",
         type=str,
         required=True,
-        help="Absolute path to the directory where browser downloads should be saved.",
+        help=(
+            "Absolute path to the directory where browser downloads should be saved. With --prompts-file "
+            "or --serve, each task without its own 'target_download_dir' saves into a task_<index> "
+            "subdirectory, numbered in file order or, with --serve, in arrival order."
+        ),
     )
     p.add_argument(
         "--allowed-domains",
@@ -51,11 +89,55 @@ def parse_agent_args():
         default=3,
         help="Maximum number of failures an agent can incur before failing the execution run.",
     )
+    p.add_argument(
+        "--download-timeout-ms",
+        type=int,
+        default=30000,
+        help="How long to wait after a download click for the download to start. The download itself may take longer.",
+    )
     p.add_argument(
         "--data-dir",
         type=str,
         default=None,
         help="Browser data directory to use for the agent's browser.",
     )
-    return p.parse_args()
+    p.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=5,
+        help=(
+            "Maximum number of agents run concurrently with --prompts-file. browser_use serializes "
+            "some work behind a process-global event bus lock, so beyond ~3 agents prefer running "
+            "multiple processes."
+        ),
+    )
+    p.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="Number of browser sessions to pre-warm and reuse across tasks. Defaults to the effective concurrency.",
+    )
+    p.add_argument(
+        "--result-cache",
+        type=str,
+        default=None,
+        metavar="SQLITE_PATH",
+        help=(
+            "Reuse final results of previous runs of the same task from this SQLite file instead of "
+            "running the agent again. Only for tasks with stable answers and no side effects."
+        ),
+    )
+    p.add_argument(
+        "--cacheable-memory",
+        action="store_true",
+        help=(
+            "Keep the agent's message history append-only and trim old steps in one chunk once it "
+            "passes 40 messages or ~50k tokens, so the provider's prompt cache keeps hitting."
+        ),
+    )
+    return p
+
+
+def parse_agent_args(argv=None):
+    return _parser().parse_args(argv)
 
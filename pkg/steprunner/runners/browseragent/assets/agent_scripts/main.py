@@ -1,37 +1,166 @@
+from __future__ import annotations
+
+import argparse
 import asyncio
+import functools
+import itertools
 import json
+import logging
 import os
+import signal
+import stat
+import threading
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Type
+from typing import TYPE_CHECKING, Optional, Type
+
+import orjson
 
 import cli
-import models
-import actions
-import settings
 
-from langchain_openai import ChatOpenAI
-from pydantic import BaseModel as PydanticBaseModel
-from browser_use import Agent, BrowserSession, Controller
+# browser_use, langchain_openai and the modules that pull them in are imported where they are
+# first needed, so --help and argument errors return without paying their import cost
+if TYPE_CHECKING:
+    import httpx
+    from langchain_openai import ChatOpenAI
+    from pydantic import BaseModel as PydanticBaseModel
+    from browser_use import Controller
+    from browser_use.controller.registry.views import RegisteredAction
+    from session_pool import BrowserSessionPool
+    from result_cache import ResultCache
 
+logger = logging.getLogger("dropstep.main")
 
-async def run_agent_logic():
-    args = cli.parse_agent_args()
+# the Go runner reads results after this process exits, which close() already makes visible;
+# fsync only guards against a machine crash and can cost tens of ms, so it is opt-in
+FSYNC_RESULTS = os.getenv("DROPSTEP_FSYNC") == "1"
+# longest --serve request line; an inline output_schema easily outgrows asyncio's 64 KiB default
+SERVE_REQUEST_LIMIT = 16 * 1024 * 1024
 
-    browser_profile_obj = settings.create_browser_profile(
-        args.target_download_dir, user_data_dir=args.data_dir
+EXTEND_SYSTEM_MESSAGE = """
+    When clicking on an element, default to the force_click_element_impl action. If that fails, use the click_element_by_index action.
+    When downloading a file, use the click_and_wait_for_download_impl action. Be sure to follow this with a get_last_downloaded_file_info_impl action to confirm the file was downloaded and note file path and metadata.
+    When uploading a file, use the upload_file_impl action.
+    """
+
+
+@dataclass
+class AgentRuntime:
+    """Process-wide state built once and shared by every task the process runs."""
+
+    args: argparse.Namespace
+    controller: Controller
+    llm: ChatOpenAI
+    http_client: httpx.AsyncClient
+    pool: BrowserSessionPool
+    max_concurrency: int
+    sem: asyncio.Semaphore
+    result_cache: Optional[ResultCache] = None
+    llm_warmup: Optional[asyncio.Task] = None
+
+
+@dataclass
+class TaskSpec:
+    """A prompt plus optional per-task overrides of the process-wide --output-schema/--upload-file-paths."""
+
+    prompt: str
+    output_schema: Optional[str] = None
+    upload_file_paths: Optional[list[str]] = None
+    # only used to order a batch, longest first
+    estimated_seconds: Optional[float] = None
+    # where this task's downloads go instead of --target-download-dir; the pooled browser is reused
+    target_download_dir: Optional[str] = None
+
+    @classmethod
+    def from_entry(cls, entry) -> TaskSpec:
+        """Accepts a bare prompt string or an object with a 'prompt' key and optional overrides."""
+        if isinstance(entry, str):
+            entry = {"prompt": entry}
+        if not isinstance(entry, dict):
+            raise ValueError("expected a JSON string or an object with a 'prompt' key")
+        prompt = entry.get("prompt")
+        if not isinstance(prompt, str) or not prompt:
+            raise ValueError("expected a JSON string or an object with a 'prompt' key")
+        output_schema = entry.get("output_schema")
+        if output_schema is not None and not isinstance(output_schema, str):
+            output_schema = json.dumps(output_schema)
+        upload_file_paths = entry.get("upload_file_paths")
+        if upload_file_paths is not None and (
+            not isinstance(upload_file_paths, list)
+            or not all(isinstance(p, str) for p in upload_file_paths)
+        ):
+            raise ValueError("'upload_file_paths' must be a list of strings")
+        if upload_file_paths is not None:
+            # same normalization argparse applies to --upload-file-paths
+            upload_file_paths = [os.path.realpath(p) for p in upload_file_paths]
+        estimated_seconds = entry.get("estimated_seconds")
+        if estimated_seconds is not None and not isinstance(estimated_seconds, (int, float)):
+            raise ValueError("'estimated_seconds' must be a number")
+        target_download_dir = entry.get("target_download_dir")
+        if target_download_dir is not None:
+            if not isinstance(target_download_dir, str) or not target_download_dir:
+                raise ValueError("'target_download_dir' must be a non-empty string")
+            target_download_dir = os.path.abspath(target_download_dir)
+        return cls(prompt, output_schema, upload_file_paths, estimated_seconds, target_download_dir)
+
+
+@functools.lru_cache(maxsize=None)
+def build_custom_actions(
+    allowed_upload_paths: frozenset[str], download_timeout_ms: int
+) -> dict[str, RegisteredAction]:
+    """
+    Registers dropstep's actions once per upload list and timeout. Registration introspects each
+    function's signature and builds its param model, so controllers for different output models
+    copy these entries instead of re-registering.
+    """
+    import actions
+    from browser_use.controller.registry.service import Registry
+
+    registry = Registry()
+    registry.action("Uploads a file from the host system...")(
+        actions.make_upload_file_action(allowed_upload_paths)
     )
+    registry.action(
+        "Retrieves information about the most recently downloaded file..."
+    )(actions.get_last_downloaded_file_info_impl)
+    registry.action(
+        "Clicks an element (by index) expected to trigger a file download and waits..."
+    )(actions.make_click_and_wait_for_download_action(download_timeout_ms))
+    registry.action(
+        "Forcefully clicks an element using a CSS selector by executing a JavaScript click event. Use this as a fallback if a normal click doesn't work."
+    )(actions.force_click_element_impl)
+    return dict(registry.registry.actions)
 
-    settings.load_environment()
+
+@functools.lru_cache(maxsize=None)
+def build_controller(
+    output_model_class: Type[PydanticBaseModel],
+    allowed_upload_paths: frozenset[str],
+    download_timeout_ms: int,
+) -> Controller:
+    from browser_use import Controller
+
+    controller = Controller(output_model=output_model_class)
+    controller.registry.registry.actions.update(
+        build_custom_actions(allowed_upload_paths, download_timeout_ms)
+    )
+    return controller
+
+
+def resolve_output_model(
+    output_schema: Optional[str], model_name: str
+) -> Type[PydanticBaseModel]:
+    import models
 
     output_model_class: Type[PydanticBaseModel] = models.Summary
-    if args.output_schema:
+    if output_schema:
         try:
-            json.loads(args.output_schema)
             output_model_class = models.get_pydantic_model_from_schema(
-                args.output_schema, args.model_name
+                output_schema, model_name
             )
-            print(f"Using output model: {output_model_class.__name__}")
-        except json.JSONDecodeError as e:
+            # runs for every task that overrides the schema; only worth a line when debugging
+            logger.debug("Using output model: %s", output_model_class.__name__)
+        except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
             print(
                 f"Error: --output-schema is not valid JSON: {e}. Defaulting to Summary."
             )
@@ -39,29 +168,63 @@ async def run_agent_logic():
         except Exception as e:
             print(f"Error processing output schema: {e}. Defaulting to Summary.")
             output_model_class = models.Summary
+    return output_model_class
 
-    controller = Controller(output_model=output_model_class)
 
-    controller.action("Uploads a file from the host system...")(
-        actions.upload_file_action_impl
+def controller_for(
+    args: argparse.Namespace, output_schema: Optional[str], upload_file_paths: list[str]
+) -> Controller:
+    # both steps are cached, so tasks sharing a schema and upload list share one controller
+    output_model_class = resolve_output_model(output_schema, args.model_name)
+    # paths arrive realpath'd from argparse / TaskSpec, so symlinks can't be used to escape the list
+    allowed_upload_paths = frozenset(upload_file_paths)
+    return build_controller(
+        output_model_class, allowed_upload_paths, args.download_timeout_ms
     )
-    controller.action(
-        "Retrieves information about the most recently downloaded file..."
-    )(actions.get_last_downloaded_file_info_impl)
-    controller.action(
-        "Clicks an element (by index) expected to trigger a file download and waits..."
-    )(actions.click_and_wait_for_download_impl)
-    controller.action(
-        "Forcefully clicks an element using a CSS selector by executing a JavaScript click event. Use this as a fallback if a normal click doesn't work."
-    )(actions.force_click_element_impl)
 
-    api_key = settings.get_openai_api_key()
-    llm_instance = ChatOpenAI(
-        model="gpt-4o",
-        temperature=0.3,
-        api_key=api_key,
+
+def open_result_cache(args: argparse.Namespace) -> Optional[ResultCache]:
+    if not args.result_cache:
+        return None
+    from result_cache import ResultCache
+
+    return ResultCache(args.result_cache)
+
+
+def result_cache_key(
+    args: argparse.Namespace,
+    prompt: str,
+    output_schema: Optional[str],
+    upload_file_paths: list[str],
+) -> str:
+    from result_cache import ResultCache
+
+    return ResultCache.make_key(
+        prompt,
+        output_schema=output_schema,
+        model_name=args.model_name,
+        allowed_domains=args.allowed_domains,
+        upload_file_paths=upload_file_paths,
     )
 
+
+async def build_runtime(
+    args: argparse.Namespace,
+    task_count: Optional[int] = None,
+    result_cache: Optional[ResultCache] = None,
+) -> AgentRuntime:
+    import httpx
+    import settings
+    from langchain_openai import ChatOpenAI
+    from session_pool import BrowserSessionPool
+
+    browser_profile_obj = settings.create_browser_profile(
+        args.target_download_dir, user_data_dir=args.data_dir
+    )
+
+    settings.load_environment()
+    settings.configure_logging()
+
     browser_session_args = {
         "headless": False,
         "browser_profile": browser_profile_obj,
@@ -71,60 +234,462 @@ async def run_agent_logic():
         browser_session_args["allowed_domains"] = args.allowed_domains
         print(f"Restricting navigation to domains: {args.allowed_domains}")
 
-    browser_session = BrowserSession(**browser_session_args)
+    max_concurrency = max(1, args.max_concurrency)
+    if task_count is not None:
+        max_concurrency = max(1, min(max_concurrency, task_count))
+    pool_size = args.pool_size if args.pool_size is not None else max_concurrency
+    if args.data_dir and (max_concurrency > 1 or pool_size > 1):
+        # Chromium cannot open one user data dir from several processes at once
+        print("Warning: --data-dir is set, running tasks one at a time.")
+        max_concurrency = pool_size = 1
 
-    extend_system_message = """
-    When clicking on an element, default to the force_click_element_impl action. If that fails, use the click_element_by_index action.
-    When downloading a file, use the click_and_wait_for_download_impl action. Be sure to follow this with a get_last_downloaded_file_info_impl action to confirm the file was downloaded and note file path and metadata.
-    When uploading a file, use the upload_file_impl action.
-    """
+    # opened before any browser launches, so a bad path fails without anything to clean up
+    opened_result_cache = None
+    if result_cache is None:
+        result_cache = opened_result_cache = open_result_cache(args)
 
-    agent = Agent(
-        task=args.prompt,
-        llm=llm_instance,
-        controller=controller,
-        browser_session=browser_session,
-        available_file_paths=args.upload_file_paths,
-        max_failures=args.max_failures,
-        extend_system_message=extend_system_message,
+    # a persistent profile exists to keep logins around, so don't wipe its cookies
+    pool = BrowserSessionPool(
+        pool_size, clear_cookies=not args.data_dir, **browser_session_args
     )
+    # Chromium launches in the background while the rest of the runtime is built;
+    # the first pool.acquire() waits for it
+    pool.start_in_background()
 
-    result_json_str = None
+    http_client = None
     try:
-        history = await agent.run(max_steps=args.max_steps)
-        result_json_str = history.final_result()
+        # schema codegen is synchronous and can take seconds; off the loop it overlaps the Chromium
+        # launch above instead of holding it back until the controller is built
+        controller = await asyncio.to_thread(
+            controller_for, args, args.output_schema, args.upload_file_paths
+        )
+
+        api_key = settings.get_openai_api_key()
+        # one HTTP/2 client for the whole process: concurrent agent steps multiplex over one
+        # warm TLS connection instead of each paying a handshake
+        http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0),
+            limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        )
+        llm_instance = ChatOpenAI(
+            model="gpt-4o",
+            temperature=0.3,
+            api_key=api_key,
+            http_async_client=http_client,
+        )
+    except BaseException:
+        # e.g. a bad output schema or a missing API key: stop the browsers already launching
+        await pool.close()
+        if http_client:
+            await http_client.aclose()
+        if opened_result_cache:
+            opened_result_cache.close()
+        raise
+    llm_warmup = asyncio.create_task(settings.warm_llm_connection(llm_instance))
+
+    return AgentRuntime(
+        args=args,
+        controller=controller,
+        llm=llm_instance,
+        http_client=http_client,
+        pool=pool,
+        max_concurrency=max_concurrency,
+        sem=asyncio.Semaphore(max_concurrency),
+        result_cache=result_cache,
+        llm_warmup=llm_warmup,
+    )
+
+
+def with_task_download_dir(args: argparse.Namespace, task: TaskSpec, index: int) -> TaskSpec:
+    """Gives a task without its own target_download_dir a task_<index> subdirectory of --target-download-dir."""
+    if task.target_download_dir is not None:
+        return task
+    # concurrent tasks saving the same filename into one dir would overwrite each other
+    # and read back each other's "latest download"
+    return replace(
+        task,
+        target_download_dir=os.path.join(
+            os.path.abspath(args.target_download_dir), f"task_{index}"
+        ),
+    )
+
+
+def task_settings(
+    args: argparse.Namespace, task: TaskSpec
+) -> tuple[Optional[str], list[str]]:
+    """The output schema and upload paths for a task: its own overrides, else the CLI's."""
+    output_schema = args.output_schema if task.output_schema is None else task.output_schema
+    upload_file_paths = (
+        args.upload_file_paths if task.upload_file_paths is None else task.upload_file_paths
+    )
+    return output_schema, upload_file_paths
+
+
+async def task_controller(runtime: AgentRuntime, task: TaskSpec) -> Controller:
+    if task.output_schema is None and task.upload_file_paths is None:
+        return runtime.controller
+    output_schema, upload_file_paths = task_settings(runtime.args, task)
+    # in --serve mode a new schema would otherwise stall every other running task
+    return await asyncio.to_thread(
+        controller_for, runtime.args, output_schema, upload_file_paths
+    )
+
+
+async def handle_task(
+    runtime: AgentRuntime,
+    task: TaskSpec,
+    out_path: str,
+    controller: Optional[Controller] = None,
+) -> Optional[str]:
+    from browser_use import Agent
 
+    args = runtime.args
+    prompt = task.prompt
+    output_schema, upload_file_paths = task_settings(args, task)
+    if controller is None:
+        controller = await task_controller(runtime, task)
+
+    cache_key = None
+    if runtime.result_cache:
+        cache_key = result_cache_key(args, prompt, output_schema, upload_file_paths)
+        cached_result = runtime.result_cache.get(cache_key)
+        if cached_result is not None:
+            print("Found cached result for this task, skipping agent run.")
+            await asyncio.to_thread(write_result, out_path, cached_result)
+            return cached_result
+
+    async with runtime.sem, runtime.pool.acquire(
+        downloads_dir=task.target_download_dir
+    ) as browser_session:
+        agent = Agent(
+            task=prompt,
+            llm=runtime.llm,
+            controller=controller,
+            browser_session=browser_session,
+            available_file_paths=upload_file_paths,
+            max_failures=args.max_failures,
+            extend_system_message=EXTEND_SYSTEM_MESSAGE,
+        )
+        if args.cacheable_memory:
+            from message_history import enable_cacheable_memory
+
+            enable_cacheable_memory(agent)
+
+        result_json_str = None
+        history = None
+        try:
+            history = await agent.run(max_steps=args.max_steps)
+            result_json_str = history.final_result()
+            if result_json_str is None:
+                print(
+                    f"ERROR: Agent did not produce a final JSON result. Output to {out_path} skipped."
+                )
+        except Exception as e:
+            print(f"Error during agent run: {type(e).__name__}: {e}")
+
+    # the browser session and concurrency slot are released by now, so the next queued task
+    # starts while this one's result is written
+    try:
         if result_json_str is not None:
-            output_file_path = Path(args.out)
-            output_file_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(output_file_path, "w", encoding="utf-8") as f:
-                f.write(result_json_str)
-                f.flush()
-                try:
-                    os.fsync(f.fileno())
-                except OSError as e_fsync:
-                    print(f"Warning: os.fsync error on {output_file_path}: {e_fsync}")
-            print(f"Wrote result to {args.out}")
-        else:
-            print(
-                f"ERROR: Agent did not produce a final JSON result. Output to {args.out} skipped."
-            )
+            # open + write (+ fsync) can stall on slow or network disks; keep it off the event loop
+            await asyncio.to_thread(write_result, out_path, result_json_str)
+            # final_result() is only the last action's output, also when the run hit max_steps or
+            # the agent gave up; only a run that finished with done(success=True) is worth replaying
+            if cache_key and history.is_done() and history.is_successful():
+                runtime.result_cache.put(cache_key, result_json_str)
+            return result_json_str
     except Exception as e:
-        print(f"Error during agent run: {type(e).__name__}: {e}")
+        print(f"Error writing result to {out_path}: {type(e).__name__}: {e}")
     finally:
         print("Done!")
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def ensure_dir(path: str) -> None:
+    os.makedirs(path or ".", exist_ok=True)
+
+
+def open_in_dir(path: str, flags: int, mode: int = 0o644) -> int:
+    """os.open() that creates the parent directory first, once per process and again if it was removed since."""
+    parent = os.path.dirname(path)
+    ensure_dir(parent)
+    try:
+        return os.open(path, flags, mode)
+    except FileNotFoundError:
+        os.makedirs(parent or ".", exist_ok=True)
+        return os.open(path, flags, mode)
+
+
+def write_result(out_path: str, result_json_str: str) -> None:
+    # written next to the target and renamed over it, so a reader sees the old file or the whole
+    # new one, never a partial write; pid + thread keep concurrent writers of one path apart
+    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # one encode and unbuffered writes of the bytes, no text-mode codec or buffer in between
+    buf = memoryview(result_json_str.encode("utf-8"))
+    fd = open_in_dir(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
         try:
-            if browser_session and hasattr(browser_session, "stop"):
-                print("Attempting to stop browser session...")
-                await browser_session.stop()
-                print("Browser session stopped.")
-        except AttributeError:
-            print(
-                "Browser session object or stop method not as expected or already closed."
-            )
-        except Exception as e_stop:
-            print(f"Error stopping browser session: {e_stop}")
+            while buf:
+                buf = buf[os.write(fd, buf) :]
+            if FSYNC_RESULTS:
+                try:
+                    os.fsync(fd)
+                except OSError as e_fsync:
+                    print(f"Warning: os.fsync error on {out_path}: {e_fsync}")
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    print(f"Wrote result to {out_path}")
+
+
+class ResultsLog:
+    """Appends one JSON line per finished batch task to a single file kept open for the whole batch."""
+
+    def __init__(self, path: str):
+        self._fd = open_in_dir(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+
+    def append(self, index: int, prompt: str, result_json_str: Optional[str]) -> None:
+        result = None
+        if result_json_str is not None:
+            # a structured result is JSON, but a plain run's final result is free text
+            # (e.g. the last action's message), which is stored as a string instead
+            try:
+                result = orjson.loads(result_json_str)
+            except orjson.JSONDecodeError:
+                result = result_json_str
+        buf = orjson.dumps(
+            {"index": index, "prompt": prompt, "ok": result_json_str is not None, "result": result},
+            option=orjson.OPT_APPEND_NEWLINE,
+        )
+        # called from the event loop thread only, so writes from concurrent tasks can't interleave
+        while buf:
+            buf = buf[os.write(self._fd, buf) :]
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+async def run_batch(runtime: AgentRuntime, tasks: list[TaskSpec]) -> None:
+    args = runtime.args
+    print(f"Running {len(tasks)} task(s) with max concurrency {runtime.max_concurrency}")
+    results_log = ResultsLog(args.results_jsonl) if args.results_jsonl else None
+
+    # resolved before any task queues: an await on the way to the semaphore would let tasks
+    # without overrides get ahead of longer ones with them and undo the order below
+    controllers = await asyncio.gather(
+        *[task_controller(runtime, task) for task in tasks], return_exceptions=True
+    )
+
+    async def run_one(index: int) -> Optional[str]:
+        task = tasks[index]
+        controller = controllers[index]
+        if isinstance(controller, BaseException):
+            raise controller
+        task = with_task_download_dir(args, task, index)
+        result_json_str = await handle_task(
+            runtime, task, task_output_path(args.out, index), controller
+        )
+        if results_log:
+            results_log.append(index, task.prompt, result_json_str)
+        return result_json_str
+
+    # the semaphore admits waiters in creation order, so starting the longest estimated tasks
+    # first (LPT) keeps one long task from trailing at the end; without estimates, file order
+    order = sorted(range(len(tasks)), key=lambda i: -(tasks[i].estimated_seconds or 0))
+    try:
+        ordered_results = await asyncio.gather(
+            *[run_one(i) for i in order], return_exceptions=True
+        )
+    finally:
+        if results_log:
+            results_log.close()
+    results = [None] * len(tasks)
+    for i, res in zip(order, ordered_results):
+        results[i] = res
+    succeeded = 0
+    for i, res in enumerate(results):
+        if isinstance(res, BaseException):
+            print(f"Task {i} failed: {type(res).__name__}: {res}")
+        elif res is not None:
+            succeeded += 1
+    print(f"Completed {succeeded}/{len(tasks)} task(s) successfully.")
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """Removes a socket left by an earlier --serve run; anything else at the path is an error."""
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode):
+        raise ValueError(f"{socket_path} exists and is not a socket, refusing to replace it")
+    os.unlink(socket_path)
+
+
+async def serve(runtime: AgentRuntime, socket_path: str) -> None:
+    # numbers requests across all connections, for their default download dirs
+    request_indexes = itertools.count()
+
+    async def handle_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        async def reply(message: dict) -> None:
+            writer.write(json.dumps(message).encode("utf-8") + b"\n")
+            await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # the rest of the oversized line can't be told apart from the next request
+                    await reply(
+                        {"ok": False, "error": f"Request longer than {SERVE_REQUEST_LIMIT} bytes"}
+                    )
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        # a bare string is a valid prompts-file entry, but a request needs its "out"
+                        raise ValueError("expected a JSON object with a 'prompt' key")
+                    task = with_task_download_dir(
+                        runtime.args, TaskSpec.from_entry(request), next(request_indexes)
+                    )
+                    out_path = request.get("out", runtime.args.out)
+                    if not isinstance(out_path, str) or not out_path:
+                        raise ValueError("'out' must be a non-empty string")
+                except (ValueError, KeyError, TypeError) as e:
+                    await reply({"ok": False, "error": f"Invalid request: {e}"})
+                    continue
+                try:
+                    result_json_str = await handle_task(runtime, task, out_path)
+                except Exception as e:
+                    # e.g. no browser could be launched or the task's schema doesn't compile
+                    print(f"Error running task: {type(e).__name__}: {e}")
+                    await reply({"ok": False, "error": f"{type(e).__name__}: {e}", "out": out_path})
+                    continue
+                await reply(
+                    {
+                        "ok": result_json_str is not None,
+                        "out": out_path,
+                        "target_download_dir": task.target_download_dir,
+                    }
+                )
+        finally:
+            writer.close()
+
+    import actions
+
+    # upload paths are resolved through a cache; SIGHUP drops it after files or symlinks move
+    asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, actions.clear_path_cache)
+
+    remove_stale_socket(socket_path)
+    server = await asyncio.start_unix_server(
+        handle_connection, path=socket_path, limit=SERVE_REQUEST_LIMIT
+    )
+    print(f"Serving agent tasks on {socket_path}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        remove_stale_socket(socket_path)
+
+
+def load_tasks(prompts_file: str) -> list[TaskSpec]:
+    tasks = []
+    with open(prompts_file, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tasks.append(TaskSpec.from_entry(json.loads(line)))
+            except ValueError as e:
+                raise ValueError(f"{prompts_file}:{line_no}: {e}") from e
+    return tasks
+
+
+def task_output_path(out: str, index: int) -> str:
+    out_path = Path(out)
+    return str(out_path.with_name(f"{out_path.stem}_{index}{out_path.suffix}"))
+
+
+async def run_agent_logic():
+    args = cli.parse_agent_args()
+
+    tasks = None
+    if args.prompts_file:
+        tasks = load_tasks(args.prompts_file)
+        if not tasks:
+            print(f"No tasks in {args.prompts_file}, nothing to run.")
+            return
+    elif args.prompt:
+        tasks = [TaskSpec(args.prompt)]
+
+    if args.serve:
+        # fail on a path that isn't ours before any browser is launched
+        remove_stale_socket(args.serve)
+
+    result_cache = None
+    if args.prompt and args.result_cache:
+        # a hit answers a single task without launching a browser or building a controller
+        result_cache = open_result_cache(args)
+        cached_result = result_cache.get(
+            result_cache_key(args, args.prompt, args.output_schema, args.upload_file_paths)
+        )
+        if cached_result is not None:
+            print("Found cached result for this task, skipping agent run.")
+            try:
+                write_result(args.out, cached_result)
+            except Exception as e:
+                print(f"Error writing result to {args.out}: {type(e).__name__}: {e}")
+            finally:
+                result_cache.close()
+                print("Done!")
+            return
+
+    try:
+        runtime = await build_runtime(
+            args, task_count=len(tasks) if tasks is not None else None, result_cache=result_cache
+        )
+    except BaseException:
+        if result_cache:
+            result_cache.close()
+        raise
+    try:
+        if args.serve:
+            await serve(runtime, args.serve)
+        elif args.prompts_file:
+            await run_batch(runtime, tasks)
+        else:
+            await handle_task(runtime, tasks[0], args.out)
+    finally:
+        if runtime.llm_warmup and not runtime.llm_warmup.done():
+            runtime.llm_warmup.cancel()
+        await runtime.pool.close()
+        await runtime.http_client.aclose()
+        if runtime.result_cache:
+            runtime.result_cache.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(run_agent_logic())
+    try:
+        # libuv loop: cheaper callbacks for the Playwright/CDP and OpenAI traffic; not on Windows
+        import uvloop
+
+        run = uvloop.run
+    except ImportError:
+        run = asyncio.run
+    run(run_agent_logic())
@@ -0,0 +1,69 @@
+from langchain_core.messages import ToolMessage
+
+# Past either limit the older part of the task history is dropped in one go, down to half the
+# message or token budget. Trimming a little every step would shift everything after the fixed
+# prompt prefix on each call and miss the provider's prompt cache every time; one large cut
+# re-pays the cache write once and then the new prefix stays stable until the history has
+# grown by another half budget.
+MAX_HISTORY_MESSAGES = 40
+MAX_HISTORY_TOKENS = 50_000
+
+HISTORY_MARKER = "[Your task history memory starts here]"
+
+
+def enable_cacheable_memory(
+    agent, max_messages: int = MAX_HISTORY_MESSAGES, max_tokens: int = MAX_HISTORY_TOKENS
+) -> None:
+    """
+    Keeps the agent's message history append-only with a fixed system + task prefix, so
+    OpenAI's automatic prompt cache keeps hitting on it, and bounds its size by trimming
+    old steps in a single chunk once it grows past max_messages or max_tokens.
+    """
+    message_manager = agent._message_manager
+    get_messages = message_manager.get_messages
+
+    def get_messages_with_trim():
+        _trim_history(message_manager.state.history, max_messages, max_tokens)
+        return get_messages()
+
+    message_manager.get_messages = get_messages_with_trim
+
+
+def _trim_history(history, max_messages: int, max_tokens: int) -> None:
+    messages = history.messages
+    if len(messages) <= max_messages and history.current_tokens <= max_tokens:
+        return
+
+    # the system prompt, task and example messages are tagged "init" and form the cached prefix;
+    # the untagged history marker sits just before the file paths message, or last if there is none
+    prefix_len = 1 + max(
+        (i for i, m in enumerate(messages) if m.metadata.message_type == "init"), default=-1
+    )
+    if prefix_len < len(messages) and messages[prefix_len].message.content == HISTORY_MARKER:
+        prefix_len += 1
+
+    cut = prefix_len
+    if len(messages) > max_messages:
+        cut = len(messages) - max_messages // 2
+    if history.current_tokens > max_tokens:
+        # back down to half the token budget, not to a message count: a few large messages would
+        # otherwise keep the history over the limit and re-trigger a small cut every other step
+        tokens = history.current_tokens
+        token_cut = prefix_len
+        while token_cut < len(messages) - 1 and tokens > max_tokens // 2:
+            tokens -= messages[token_cut].metadata.tokens
+            token_cut += 1
+        cut = max(cut, token_cut)
+    # a tool result must follow the AI message that called it, never start the kept tail
+    while cut < len(messages) - 1 and isinstance(messages[cut].message, ToolMessage):
+        cut += 1
+    if cut <= prefix_len:
+        return
+
+    dropped = messages[prefix_len:cut]
+    del messages[prefix_len:cut]
+    history.current_tokens -= sum(m.metadata.tokens for m in dropped)
+    print(
+        f"Trimmed {len(dropped)} old message(s) from agent history, {len(messages)} remain "
+        f"(~{history.current_tokens} tokens)."
+    )
@@ -1,85 +1,329 @@
-import json
+import functools
+import hashlib
+import importlib.metadata
 import os
+import stat
 import sys
 import tempfile
-import importlib.util
+import threading
+import types
+import keyword
+import logging
+import orjson
 from pathlib import Path
-from typing import Type, Optional
-from pydantic import BaseModel as PydanticBaseModel
+from typing import Any, List, Type, Optional
+from pydantic import BaseModel as PydanticBaseModel, ConfigDict, Field, create_model
 
-from datamodel_code_generator import (
-    generate,
-    InputFileType,
-    DataModelType,
-)
+logger = logging.getLogger("dropstep.models")
 
 class Summary(PydanticBaseModel):
     summary: str
 
+_SCALAR_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool}
+# anything outside these keywords (anyOf, enum, format, constraints, ...) goes through codegen
+_SIMPLE_SCHEMA_KEYS = {"type", "title", "description", "default", "items", "properties", "required", "$schema"}
+# a field that only points at a shared definition, optionally with its own description
+_REF_SCHEMA_KEYS = {"$ref", "description"}
+_DEFS_KEYS = ("$defs", "definitions")
+
+
+class _UnsupportedSchema(Exception):
+    pass
+
+
+class _Refs:
+    """Local definitions of the root schema, and the models built from them so far."""
+
+    def __init__(self, root: dict, root_name: str):
+        self.defs = {
+            f"#/{defs_key}/{name}": definition
+            for defs_key in _DEFS_KEYS
+            for name, definition in (root.get(defs_key) or {}).items()
+        }
+        self.models: dict[str, Any] = {}
+        self.class_names = {root_name}
+
+    def class_name(self, base: str) -> str:
+        """base, or base1, base2, ... if a class of that name was already built, as codegen numbers them."""
+        name, n = base, 0
+        while name in self.class_names:
+            n += 1
+            name = f"{base}{n}"
+        self.class_names.add(name)
+        return name
+
+    def resolve(self, ref: Any) -> Any:
+        if ref in self.models:
+            model = self.models[ref]
+            if model is None:
+                # a definition that refers back to itself needs forward refs; leave it to codegen
+                raise _UnsupportedSchema(ref)
+            return model
+        definition = self.defs.get(ref) if isinstance(ref, str) else None
+        def_name = ref.rpartition("/")[2] if definition is not None else ""
+        if not def_name.replace("_", "").isalnum() or not def_name[:1].isalpha():
+            raise _UnsupportedSchema(ref)
+        self.models[ref] = None
+        # codegen names a definition's class after its key in CamelCase, ignoring any title
+        class_name = "".join(part[:1].upper() + part[1:] for part in def_name.split("_"))
+        # codegen wraps any other definition in a RootModel class; those are left to it
+        if not isinstance(definition, dict) or definition.get("type") != "object" or \
+           not definition.get("properties") or not definition.keys() <= _SIMPLE_SCHEMA_KEYS:
+            raise _UnsupportedSchema(ref)
+        model = _build_model(definition, self.class_name(class_name), self)
+        self.models[ref] = model
+        return model
+
+
+def _field_type(schema: Any, name: str, refs: _Refs) -> Any:
+    if isinstance(schema, dict) and "$ref" in schema and schema.keys() <= _REF_SCHEMA_KEYS:
+        return refs.resolve(schema["$ref"])
+    if not isinstance(schema, dict) or not schema.keys() <= _SIMPLE_SCHEMA_KEYS:
+        raise _UnsupportedSchema(name)
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        # ["string", "null"] and the like, common in schemas written for OpenAI structured output
+        non_null = [t for t in schema_type if t != "null"]
+        if len(schema_type) == 2 and len(non_null) == 1:
+            return Optional[_field_type({**schema, "type": non_null[0]}, name, refs)]
+        raise _UnsupportedSchema(name)
+    if schema_type in _SCALAR_TYPES:
+        return _SCALAR_TYPES[schema_type]
+    if schema_type == "array" and "items" in schema:
+        return List[_field_type(schema["items"], name, refs)]
+    if schema_type == "object" and schema.get("properties"):
+        # named after the field like codegen does, which ignores the nested object's title
+        return _build_model(schema, refs.class_name(name[:1].upper() + name[1:]), refs)
+    raise _UnsupportedSchema(name)
+
+
+def _build_model(schema: dict, model_name: str, refs: _Refs) -> Type[PydanticBaseModel]:
+    """
+    Builds a model straight from a simple object schema with create_model, the same shape
+    datamodel-codegen would emit: required fields are plain, the rest Optional with default None.
+    """
+    required = set(schema.get("required", []))
+    fields = {}
+    for field_name, field_schema in schema["properties"].items():
+        # names codegen would have to alias or rename
+        if not field_name.isidentifier() or keyword.iskeyword(field_name) or \
+           field_name.startswith("_") or hasattr(PydanticBaseModel, field_name):
+            raise _UnsupportedSchema(field_name)
+        field_type = _field_type(field_schema, field_name, refs)
+        description = field_schema.get("description")
+        # codegen gives a nullable field a None default even when it is listed as required
+        if field_name in required and not isinstance(field_schema.get("type"), list):
+            fields[field_name] = (field_type, Field(..., description=description))
+        else:
+            fields[field_name] = (Optional[field_type], Field(field_schema.get("default"), description=description))
+    # the model is only ever used as a field of browser_use's action models, which build one
+    # core schema covering it; deferring skips building a separate one for each class here
+    return create_model(model_name, __config__=ConfigDict(defer_build=True), **fields)
+
+
+def _build_simple_model(schema: Any, model_name: str) -> Optional[Type[PydanticBaseModel]]:
+    if not isinstance(schema, dict) or schema.get("type") != "object" or not schema.get("properties"):
+        return None
+    # definitions are only allowed at the root, where local $refs point
+    if not schema.keys() - set(_DEFS_KEYS) <= _SIMPLE_SCHEMA_KEYS:
+        return None
+    try:
+        return _build_model(schema, model_name, _Refs(schema, model_name))
+    except _UnsupportedSchema:
+        return None
+
+
+def _make_private_dirs(path: Path, levels: int) -> None:
+    """
+    Creates path like mkdir(parents=True), but path and the levels-1 directories above it get mode
+    0o700 when created here; mkdir's mode only reaches the leaf, the rest would follow the umask.
+    """
+    owned = [path, *path.parents][:levels]
+    owned[-1].parent.mkdir(parents=True, exist_ok=True)
+    for directory in reversed(owned):
+        try:
+            directory.mkdir(mode=0o700)
+        except FileExistsError:
+            continue
+        # a umask can also strip owner bits from the mkdir mode
+        os.chmod(directory, 0o700)
+
+
+def _shared_dir(path: Path, levels: int) -> Optional[Path]:
+    """
+    Cached modules are exec'd, so path and the levels-1 directories above it must be owned by
+    this user and not writable by group or others, or another user could plant or swap one.
+    Returns the first directory that is not, or None when all of them are private.
+    """
+    if not hasattr(os, "getuid"):
+        return None
+    for directory in [path, *path.parents][:levels]:
+        st = os.stat(directory)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+            return directory
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _model_cache_dir() -> Optional[Path]:
+    # the Go runner points this at its persistent cache dir so generated models outlive the run;
+    # manual runs use the per-user cache, never a shared temp dir
+    base = os.getenv("DROPSTEP_CACHE_DIR")
+    if base:
+        cache_dir = Path(base) / "dropstep_models"
+    else:
+        cache_dir = Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "dropstep" / "models"
+    # one directory per codegen version, so an upgrade never serves modules an older release emitted;
+    # the version comes from package metadata, importing the package itself would cost seconds
+    try:
+        codegen_version = importlib.metadata.version("datamodel-code-generator")
+    except importlib.metadata.PackageNotFoundError:
+        codegen_version = "unknown"
+    cache_dir = cache_dir / codegen_version
+    # the version dir, the models dir and the base dir above them
+    levels = 3 if base else 4
+    try:
+        _make_private_dirs(cache_dir, levels)
+        shared_dir = _shared_dir(cache_dir, levels)
+        if shared_dir is None:
+            return cache_dir
+        print(
+            f"Warning: {shared_dir} is not a directory private to this user, "
+            "not caching generated models."
+        )
+    except OSError as e:
+        print(f"Warning: could not create model cache dir {cache_dir}: {e}")
+    return None
+
+
+def _generate_model_source(json_schema_str: str, model_name: str, output_path: Optional[Path]) -> bytes:
+    """Runs codegen and returns the module source, caching it at output_path when one is given."""
+    # datamodel_code_generator takes seconds to import; only pay that on a cache miss
+    from datamodel_code_generator import (
+        generate,
+        InputFileType,
+        DataModelType,
+    )
+
+    def run_codegen(path: Path) -> bytes:
+        generate(
+            json_schema_str,
+            input_file_type=InputFileType.JsonSchema,
+            input_filename="schema.json",
+            output=path,
+            output_model_type=DataModelType.PydanticV2BaseModel,
+            class_name=model_name,
+        )
+        return path.read_bytes()
+
+    # codegen writes to a file rather than a redirected stdout: this runs in a worker thread and
+    # sys.stdout is shared with the event loop's prints
+    if output_path is None:
+        with tempfile.TemporaryDirectory(prefix="dropstep_model_") as tmp_dir:
+            return run_codegen(Path(tmp_dir) / "model.py")
+
+    # the temp name plus rename means a concurrent run never reads a half-written file
+    tmp_output_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        model_source = run_codegen(tmp_output_path)
+        os.replace(tmp_output_path, output_path)
+    finally:
+        tmp_output_path.unlink(missing_ok=True)
+    return model_source
+
+
+# loaded models by sha256(model_name + "\0" + schema); only successes are kept, so a schema that
+# fell back to Summary (e.g. on a transient disk error) is retried by the next task in --serve mode
+_MODEL_CACHE: dict[str, Type[PydanticBaseModel]] = {}
+_CODEGEN_LOCK = threading.Lock()
+
+
 def get_pydantic_model_from_schema(
     json_schema_str: str,
     model_name: str = "DynamicOutputModel"
 ) -> Type[PydanticBaseModel]:
-    with tempfile.NamedTemporaryFile(mode="w+", suffix=".py", delete=False) as tmp_model_file:
-        output_path = Path(tmp_model_file.name)
-        generated_model_class: Optional[Type[PydanticBaseModel]] = None
-        temp_dir = str(output_path.parent)
-        module_name_for_import = f"temp_dyn_model_{output_path.stem}"
+    key = hashlib.sha256((model_name + "\x00" + json_schema_str).encode("utf-8")).hexdigest()
+    cached_model = _MODEL_CACHE.get(key)
+    if cached_model is not None:
+        return cached_model
 
-        try:
-            generate(
-                json_schema_str,
-                input_file_type=InputFileType.JsonSchema,
-                input_filename="schema.json",
-                output=output_path,
-                output_model_type=DataModelType.PydanticV2BaseModel,
-                class_name=model_name,
-            )
+    # the one parse of the schema on the cached paths; codegen only sees the string on a miss
+    schema = orjson.loads(json_schema_str)
+    simple_model = _build_simple_model(schema, model_name)
+    if simple_model is not None:
+        _MODEL_CACHE[key] = simple_model
+        return simple_model
 
-            if temp_dir not in sys.path:
-                sys.path.insert(0, temp_dir)
+    # callers run this in worker threads; two loads of one module at once would register and exec
+    # into the same sys.modules entry, and a failing one would pop the other's module
+    with _CODEGEN_LOCK:
+        cached_model = _MODEL_CACHE.get(key)
+        if cached_model is not None:
+            return cached_model
+        return _load_generated_model(json_schema_str, model_name, key)
 
-            spec = importlib.util.spec_from_file_location(module_name_for_import, str(output_path))
-            if not spec or not spec.loader:
-                raise ImportError(f"Could not create module spec for {output_path}")
 
-            generated_module = importlib.util.module_from_spec(spec)
-            sys.modules[module_name_for_import] = generated_module
-            spec.loader.exec_module(generated_module)
+def _load_generated_model(json_schema_str: str, model_name: str, key: str) -> Type[PydanticBaseModel]:
+    cache_dir = _model_cache_dir()
+    output_path = cache_dir / f"{key}.py" if cache_dir is not None else None
+    source_name = str(output_path) if output_path is not None else f"<schema {key[:16]}>"
+    generated_model_class: Optional[Type[PydanticBaseModel]] = None
+    module_name_for_import = f"temp_dyn_model_{key[:16]}"
 
-            model_class_candidate = None
-            if hasattr(generated_module, model_name) and \
-               isinstance(getattr(generated_module, model_name), type) and \
-               issubclass(getattr(generated_module, model_name), PydanticBaseModel):
-                model_class_candidate = getattr(generated_module, model_name)
-            else:
-                for name, obj in vars(generated_module).items():
-                    if isinstance(obj, type) and \
-                       issubclass(obj, PydanticBaseModel) and \
-                       obj is not PydanticBaseModel and obj is not Summary:
-                        model_class_candidate = obj
-                        break
-            
-            if model_class_candidate:
-                model_class_candidate.model_rebuild(force=True)
-                generated_model_class = model_class_candidate
+    # kept as bytes: compile() decodes it itself, and only the debug dump below needs a str
+    model_source: Optional[bytes] = None
+    try:
+        generated_module = sys.modules.get(module_name_for_import)
+        if generated_module is None:
+            if output_path is not None and output_path.exists():
+                logger.debug("Using cached generated model %s", output_path)
+                model_source = output_path.read_bytes()
             else:
-                print(f"Error: Could not load Pydantic model from {module_name_for_import}.")
-        except Exception as e:
-            print(f"ERROR CAUGHT in get_pydantic_model_from_schema: {type(e).__name__}: {e}")
-            if output_path.exists():
-                print(f"Generated code (if any) at: {output_path}")
-        finally:
-            if module_name_for_import in sys.modules:
-                del sys.modules[module_name_for_import]
-            if temp_dir in sys.path:
-                sys.path.remove(temp_dir)
-            if output_path.exists():
-                pyc_file = output_path.with_suffix('.pyc')
-                if pyc_file.exists():
-                    try: os.unlink(pyc_file)
-                    except: pass
-                try: os.unlink(output_path)
-                except Exception as e_unlink: print(f"Warning: Could not delete {output_path}: {e_unlink}")
-        
-        return generated_model_class if generated_model_class else Summary
\ No newline at end of file
+                model_source = _generate_model_source(json_schema_str, model_name, output_path)
+
+            # executed straight from the source string: no importlib spec and no sys.path entry.
+            # It is registered in sys.modules first because pydantic resolves the module's
+            # postponed annotations through it.
+            generated_module = types.ModuleType(module_name_for_import)
+            generated_module.__file__ = source_name
+            sys.modules[module_name_for_import] = generated_module
+            exec(compile(model_source, source_name, "exec"), generated_module.__dict__)
+
+        # codegen names the root class after class_name (and rejects names it can't use), so this
+        # one lookup is the normal path; the scan only covers a renamed root
+        model_class_candidate = getattr(generated_module, model_name, None)
+        if not (isinstance(model_class_candidate, type) and issubclass(model_class_candidate, PydanticBaseModel)):
+            model_class_candidate = next(
+                (
+                    obj for obj in vars(generated_module).values()
+                    if isinstance(obj, type) and issubclass(obj, PydanticBaseModel)
+                    and obj.__module__ == module_name_for_import
+                ),
+                None,
+            )
+
+        if model_class_candidate:
+            # codegen orders classes so references resolve at class creation; only rebuild
+            # (a full core-schema build) when pydantic left forward refs unresolved
+            if not model_class_candidate.__pydantic_complete__:
+                model_class_candidate.model_rebuild()
+            generated_model_class = model_class_candidate
+            _MODEL_CACHE[key] = generated_model_class
+        else:
+            print(f"Error: Could not load Pydantic model from {module_name_for_import}.")
+    except Exception as e:
+        print(f"ERROR CAUGHT in get_pydantic_model_from_schema: {type(e).__name__}: {e}")
+    finally:
+        # a module that loaded is kept under its hash name so the next call skips the import
+        if not generated_model_class:
+            sys.modules.pop(module_name_for_import, None)
+
+    if not generated_model_class and output_path is not None and output_path.exists():
+        if model_source is not None and logger.isEnabledFor(logging.DEBUG):
+            # the file is deleted below, so this is the only chance to see what codegen produced
+            logger.debug("Generated code at %s:\n%s", output_path, model_source.decode("utf-8", "replace"))
+        # don't keep serving a cached module that doesn't load
+        try: os.unlink(output_path)
+        except Exception as e_unlink: print(f"Warning: Could not delete {output_path}: {e_unlink}")
+
+    return generated_model_class if generated_model_class else Summary
@@ -1,15 +1,47 @@
-from steel import Steel
+from steel import AsyncSteel
+import asyncio
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
-client = Steel(steel_api_key=os.getenv("STEEL_API_KEY"))
+# each release is one HTTP round-trip; this many run at once instead of one after another
+MAX_CONCURRENT_RELEASES = 32
 
-# This will lazily iterate through all sessions
-session_count = 0
-for session in client.sessions.list():
-    print(f"Releasing session: {session.id}")
-    client.sessions.release(session.id)
-    session_count += 1
 
-print(f"Released {session_count} session(s).")
+async def release_all_sessions() -> None:
+    client = AsyncSteel(steel_api_key=os.getenv("STEEL_API_KEY"))
+    # bounded so listing runs at most a couple of pages ahead of the releases
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_CONCURRENT_RELEASES * 2)
+    released = 0
+    failed = 0
+
+    async def worker() -> None:
+        nonlocal released, failed
+        while (session_id := await queue.get()) is not None:
+            try:
+                await client.sessions.release(session_id)
+                print(f"Released session: {session_id}")
+                released += 1
+            except Exception as e:
+                print(f"Failed to release session {session_id}: {type(e).__name__}: {e}")
+                failed += 1
+
+    workers = [asyncio.create_task(worker()) for _ in range(MAX_CONCURRENT_RELEASES)]
+    try:
+        # This will lazily iterate through all sessions; the next page loads while workers release
+        async for session in client.sessions.list():
+            print(f"Releasing session: {session.id}")
+            await queue.put(session.id)
+    finally:
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        await client.close()
+
+    print(f"Released {released} session(s).")
+    if failed:
+        print(f"Failed to release {failed} session(s).")
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(release_all_sessions())
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Optional
+
+
+class ResultCache:
+    """
+    Persistent map from a normalized task to the final JSON result a previous agent run produced.
+    A hit skips the whole LLM + browser loop, so only enable it for tasks whose answer is stable
+    and that have no side effects the caller relies on (uploads, downloads, form submissions).
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, **context) -> str:
+        # whitespace is normalized but case is kept: prompts often quote text to type verbatim
+        normalized = " ".join(prompt.split())
+        payload = json.dumps({"prompt": normalized, **context}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, result: str) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO results (key, result, created_at) VALUES (?, ?, ?)",
+            (key, result, time.time()),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
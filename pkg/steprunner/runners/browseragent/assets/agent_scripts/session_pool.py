@@ -0,0 +1,106 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from browser_use import BrowserSession
+
+
+class BrowserSessionPool:
+    """
+    Pre-warms a fixed number of browser sessions and hands them out to agent tasks,
+    so Chromium startup is paid once per pooled session instead of once per task.
+    Sessions are reset (extra tabs closed, about:blank, cookies cleared) between tasks.
+    """
+
+    def __init__(self, pool_size: int, clear_cookies: bool = True, **session_kwargs):
+        self.pool_size = max(1, pool_size)
+        self.clear_cookies = clear_cookies
+        self.session_kwargs = session_kwargs
+        self._idle: asyncio.Queue[BrowserSession] = asyncio.Queue(maxsize=self.pool_size)
+        self._sessions: list[BrowserSession] = []
+        self._warmup: Optional[asyncio.Task] = None
+
+    def _new_session(self) -> BrowserSession:
+        # keep_alive stops Agent.run() from killing the browser when a task finishes
+        session = BrowserSession(keep_alive=True, **self.session_kwargs)
+        self._sessions.append(session)
+        return session
+
+    async def start(self) -> None:
+        sessions = [self._new_session() for _ in range(self.pool_size)]
+        results = await asyncio.gather(*[s.start() for s in sessions], return_exceptions=True)
+        for session, res in zip(sessions, results):
+            if isinstance(res, BaseException):
+                print(f"Warning: failed to pre-warm browser session: {type(res).__name__}: {res}")
+                await self._discard(session)
+            else:
+                self._idle.put_nowait(session)
+
+    def start_in_background(self) -> None:
+        self._warmup = asyncio.create_task(self.start())
+
+    @asynccontextmanager
+    async def acquire(self, downloads_dir: Optional[str] = None) -> AsyncIterator[BrowserSession]:
+        """
+        Yields an idle session, starting one if none is left. With downloads_dir, the session's
+        download actions save there for the duration of the task instead of the profile default.
+        """
+        if self._warmup:
+            await self._warmup
+        try:
+            session = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            print("Browser session pool exhausted, starting a session on demand.")
+            session = self._new_session()
+            await session.start()
+        # each session holds its own copy of the profile, so this doesn't leak into other tasks
+        default_downloads_dir = session.browser_profile.downloads_dir
+        try:
+            if downloads_dir:
+                os.makedirs(downloads_dir, exist_ok=True)
+                session.browser_profile.downloads_dir = downloads_dir
+            yield session
+        finally:
+            session.browser_profile.downloads_dir = default_downloads_dir
+            await self._release(session)
+
+    async def _release(self, session: BrowserSession) -> None:
+        if self._idle.full():
+            await self._discard(session)
+            return
+        try:
+            await self._reset(session)
+        except Exception as e:
+            print(f"Warning: could not reset browser session, discarding it: {type(e).__name__}: {e}")
+            await self._discard(session)
+            return
+        self._idle.put_nowait(session)
+
+    async def _reset(self, session: BrowserSession) -> None:
+        context = session.browser_context
+        pages = list(context.pages)
+        for page in pages[1:]:
+            await page.close()
+        page = pages[0] if pages else await context.new_page()
+        await page.goto("about:blank")
+        if self.clear_cookies:
+            await context.clear_cookies()
+
+    async def _discard(self, session: BrowserSession) -> None:
+        if session in self._sessions:
+            self._sessions.remove(session)
+        session.browser_profile.keep_alive = False
+        try:
+            await session.stop()
+        except Exception as e:
+            print(f"Error stopping browser session: {e}")
+
+    async def close(self) -> None:
+        if self._warmup:
+            # let a still-running warm-up finish so its sessions get stopped below
+            await asyncio.gather(self._warmup, return_exceptions=True)
+        print("Attempting to stop pooled browser sessions...")
+        for session in list(self._sessions):
+            await self._discard(session)
+        print("Browser sessions stopped.")
@@ -1,15 +1,67 @@
+import atexit
+import functools
+import logging
+import logging.handlers
 import os
+import queue
 import tempfile
 from typing import Optional
-from dotenv import load_dotenv
 from browser_use import BrowserProfile
 from pathlib import Path
 
 
+@functools.lru_cache(maxsize=1)
 def load_environment():
+    # the Go runner passes the key in the environment; .env is only a fallback for manual runs,
+    # so don't import dotenv or search the directory tree for a file when it's already set
+    if os.getenv("OPENAI_API_KEY"):
+        return
+    from dotenv import load_dotenv
     load_dotenv()
 
 
+_log_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging():
+    # browser_use installs the root handler; this only decides which dropstep records reach it
+    level = os.getenv("DROPSTEP_LOG_LEVEL", "WARNING").upper()
+    try:
+        logging.getLogger("dropstep").setLevel(level)
+    except ValueError:
+        print(f"Warning: invalid DROPSTEP_LOG_LEVEL {level!r}, using WARNING.")
+        logging.getLogger("dropstep").setLevel(logging.WARNING)
+    _move_log_output_off_event_loop()
+
+
+def _move_log_output_off_event_loop():
+    """
+    browser_use logs several lines per agent step through a StreamHandler that writes and flushes
+    stdout on the calling thread, so a Go parent slow to drain the pipe stalls the event loop.
+    Its handlers are moved behind a queue drained by a listener thread; records are only
+    enqueued on the loop.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+    root = logging.getLogger()
+    browser_use_logger = logging.getLogger("browser_use")
+    # browser_use attaches the same console handler to both loggers
+    handlers = list(dict.fromkeys(root.handlers + browser_use_logger.handlers))
+    if not handlers:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for logger in (root, browser_use_logger):
+        if logger.handlers:
+            logger.handlers = [queue_handler]
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    # stop() drains whatever is still queued before the process exits
+    atexit.register(_log_listener.stop)
+
+
+@functools.lru_cache(maxsize=1)
 def get_openai_api_key():
     key = os.getenv("OPENAI_API_KEY")
     if not key:
@@ -17,24 +69,31 @@ def get_openai_api_key():
     return key
 
 
+async def warm_llm_connection(llm) -> None:
+    # listing models costs no tokens but opens the pooled HTTPS connection the first step reuses
+    try:
+        await llm.root_async_client.models.list()
+    except Exception as e:
+        print(f"Warning: could not pre-warm LLM connection: {type(e).__name__}: {e}")
+
+
 def create_browser_profile(
     target_download_dir_str: Optional[str], user_data_dir: Optional[str] = None
 ) -> BrowserProfile:
     profile_args = {"user_data_dir": user_data_dir}
+    # BrowserProfile resolves downloads_dir and creates it when each session starts, so the path
+    # is handed over as given instead of being normalized here too
     if target_download_dir_str:
-        abs_target_download_dir = os.path.abspath(target_download_dir_str)
-        profile_args["downloads_dir"] = abs_target_download_dir
+        profile_args["downloads_dir"] = target_download_dir_str
     else:
         # This case should be handled by the caller (main_agent.py) ensuring a dir is always passed
         print(
             "CRITICAL ERROR: target_download_dir not provided for BrowserProfile creation!"
         )
         # Fallback to a temporary default to avoid crashing BrowserProfile init
-        dummy_dir = (
-            Path(tempfile.gettempdir()) / "dropstep_agent_dummy_downloads_fallback"
+        profile_args["downloads_dir"] = str(
+            Path(tempfile.gettempdir(), "dropstep_agent_dummy_downloads_fallback")
         )
-        dummy_dir.mkdir(parents=True, exist_ok=True)
-        profile_args["downloads_dir"] = str(dummy_dir)
 
     return BrowserProfile(**profile_args)
 
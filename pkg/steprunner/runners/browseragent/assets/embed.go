@@ -10,15 +10,18 @@ import (
 var agentScriptsFS embed.FS
 
 const (
-	agentDirInEmbed  = "agent_scripts"
-	RunScriptFile    = "run.sh"
-	MainPyFile       = "main.py"
-	CliPyFile        = "cli.py"
-	ModelsPyFile     = "models.py"
-	ActionsPyFile    = "actions.py"
-	SettingsPyFile   = "settings.py"
-	InitPyFile       = "__init__.py"
-	RequirementsFile = "requirements.txt"
+	agentDirInEmbed      = "agent_scripts"
+	RunScriptFile        = "run.sh"
+	MainPyFile           = "main.py"
+	CliPyFile            = "cli.py"
+	ModelsPyFile         = "models.py"
+	ActionsPyFile        = "actions.py"
+	SettingsPyFile       = "settings.py"
+	SessionPoolPyFile    = "session_pool.py"
+	ResultCachePyFile    = "result_cache.py"
+	MessageHistoryPyFile = "message_history.py"
+	InitPyFile           = "__init__.py"
+	RequirementsFile     = "requirements.txt"
 )
 
 func GetAgentScriptContent(filename string) ([]byte, error) {
@@ -162,6 +162,9 @@ func (s *SubprocessAgentRunner) RunAgent(
 		assets.ModelsPyFile,
 		assets.ActionsPyFile,
 		assets.SettingsPyFile,
+		assets.SessionPoolPyFile,
+		assets.ResultCachePyFile,
+		assets.MessageHistoryPyFile,
 		assets.InitPyFile,
 	}
 	for _, scriptName := range scriptsToExtract {
@@ -222,6 +225,7 @@ func (s *SubprocessAgentRunner) RunAgent(
 		"OPENAI_API_KEY="+apiKey,
 		"DROPSTEP_VENV_PYTHON="+s.venvPythonPath,
 		"DROPSTEP_AGENT_PY_PATH="+filepath.Join(runTempDir, assets.MainPyFile),
+		"DROPSTEP_CACHE_DIR="+s.agentWorkDir,
 	)
 
 	stdout, err := cmd.StdoutPipe()